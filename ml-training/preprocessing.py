@@ -0,0 +1,47 @@
+"""
+Text preprocessing shared by training and inference
+"""
+import re
+from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS, HashingVectorizer, TfidfTransformer
+from sklearn.pipeline import make_pipeline
+
+# HTML tags and anything outside alphanumerics, whitespace and basic punctuation.
+# '<' is kept out of the character class so a run of junk can't swallow the
+# start of a tag that the tag alternative should remove whole.
+_STRIP = re.compile(r'<[^>]+>|<|[^a-zA-Z0-9\s.!?<]+')
+# Same tokens as sklearn's default token_pattern
+_TOKEN = re.compile(r'\b\w\w+\b')
+
+def clean_text(text):
+    """Clean and preprocess text"""
+    text = _STRIP.sub('', text).lower()
+    return ' '.join(text.split())
+
+def analyze(doc):
+    """Unigrams and bigrams of a cleaned review, English stop words removed
+
+    Tokenizes once and builds both n-gram orders from the same token list,
+    matching ngram_range=(1, 2), stop_words='english' on a cleaned review.
+    """
+    tokens = [t for t in _TOKEN.findall(doc) if t not in ENGLISH_STOP_WORDS]
+    return tokens + [f'{a} {b}' for a, b in zip(tokens, tokens[1:])]
+
+def make_hasher(n_features, dtype):
+    """Raw n-gram counts hashed into n_features columns"""
+    return HashingVectorizer(
+        n_features=n_features,
+        analyzer=analyze,
+        dtype=dtype,
+        alternate_sign=False,
+        norm=None
+    )
+
+def build_vectorizer(idf, sublinear_tf=False):
+    """Rebuild the hashing + TF-IDF pipeline from a saved IDF vector
+
+    The hasher keeps no state beyond its column count and dtype, both of
+    which are implied by the IDF vector itself.
+    """
+    tfidf = TfidfTransformer(sublinear_tf=sublinear_tf)
+    tfidf.idf_ = idf
+    return make_pipeline(make_hasher(idf.shape[0], idf.dtype), tfidf)
@@ -1,41 +1,107 @@
 """
 Test the trained sentiment analysis model
 """
+import math
 import joblib
-import re
+import numpy as np
+from scipy.special import expit
+from sklearn.preprocessing import normalize
+from preprocessing import build_vectorizer, clean_text
 
-def clean_text(text):
-    """Clean and preprocess text"""
-    text = re.sub(r'<[^>]+>', '', text)
-    text = re.sub(r'[^a-zA-Z0-9\s\.\!\?]', '', text)
-    text = text.lower()
-    text = ' '.join(text.split())
-    return text
+try:
+    from numba import njit, prange
+except ImportError:
+    njit = None
 
-def predict_sentiment(text, model, vectorizer):
-    """Predict sentiment for a given text"""
-    cleaned = clean_text(text)
-    vec = vectorizer.transform([cleaned])
-    pred = model.predict(vec)[0]
-    prob = model.predict_proba(vec)[0]
+if njit is not None:
+    @njit(parallel=True, fastmath=True, cache=True)
+    def sigmoid_probs(z):
+        """(negative, positive) probabilities for each logit, in one pass over z"""
+        out = np.empty((z.size, 2), np.float32)
+        for i in prange(z.size):
+            p = 1.0 / (1.0 + math.exp(-z[i]))
+            out[i, 0] = 1.0 - p
+            out[i, 1] = p
+        return out
+else:
+    def sigmoid_probs(z):
+        """(negative, positive) probabilities for each logit"""
+        p1 = expit(z)
+        # Same dtype as the numba kernel, so results don't depend on the install
+        return np.column_stack([1.0 - p1, p1]).astype(np.float32)
+
+def use_inplace_idf(vectorizer):
+    """Scale hashed counts by IDF in place instead of through a diagonal matmul copy"""
+    hasher, tfidf = vectorizer[0], vectorizer[-1]
+    idf = tfidf.idf_.astype(hasher.dtype)
     
-    sentiment = "positive" if pred == 1 else "negative"
-    confidence = float(prob[pred])
+    # Counts coming out of the hasher are ephemeral, so mutating them is safe
+    def transform(X, copy=False):
+        X = X.copy() if copy else X
+        if tfidf.sublinear_tf:
+            np.log(X.data, out=X.data)
+            X.data += 1
+        np.multiply(X.data, np.take(idf, X.indices), out=X.data)
+        # Filtered columns carry a zero IDF
+        X.eliminate_zeros()
+        if tfidf.norm is not None:
+            X = normalize(X, norm=tfidf.norm, copy=False)
+        return X
+    
+    tfidf.transform = transform
+    return vectorizer
+
+# Gathered float32 weights for a review this short stay within L2 (64KB)
+DENSE_DOT_MAX_NNZ = 64 * 1024 // 8
+
+def load_weights(path):
+    """Load (coef, intercept); the sparse CSR coef is only the on-disk format,
+    scoring uses the dense float32 copy returned here"""
+    sparse_coef, b = joblib.load(path)
+    w32 = np.ascontiguousarray(sparse_coef.toarray().ravel(), dtype=np.float32)
+    return w32, b
+
+def predict_sentiment_batch(texts, weights, vectorizer):
+    """Predict sentiment for a list of texts with one transform and one sparse dot"""
+    w32, b = weights
+    if not texts:
+        return []
+    cleaned = [clean_text(text) for text in texts]
+    vecs = vectorizer.transform(cleaned)
+    # For binary LR, P(positive) is the sigmoid of the decision function
+    if vecs.shape[0] == 1 and vecs.nnz < DENSE_DOT_MAX_NNZ:
+        # Single short review: gather the weights its terms hit and take one
+        # BLAS sdot, skipping the sparse matmul machinery
+        z = np.array([np.dot(vecs.data, w32[vecs.indices])]) + b
+    else:
+        # CSR times dense float32 vector: one SpMV, no transpose or format conversion
+        z = vecs.dot(w32) + b
+    probs = sigmoid_probs(z)
+    preds = (z > 0).astype(int)
     
-    return {
-        "text": text,
-        "sentiment": sentiment,
-        "confidence": confidence,
-        "probabilities": {
-            "negative": float(prob[0]),
-            "positive": float(prob[1])
-        }
-    }
+    results = []
+    for text, pred, prob in zip(texts, preds, probs):
+        results.append({
+            "text": text,
+            "sentiment": "positive" if pred == 1 else "negative",
+            "confidence": float(prob[pred]),
+            "probabilities": {
+                "negative": float(prob[0]),
+                "positive": float(prob[1])
+            }
+        })
+    return results
+
+def predict_sentiment(text, weights, vectorizer):
+    """Predict sentiment for a given text"""
+    return predict_sentiment_batch([text], weights, vectorizer)[0]
 
 def main():
     print("Loading model and vectorizer...")
-    model = joblib.load('models/sentiment_model.pkl')
-    vectorizer = joblib.load('models/tfidf_vectorizer.pkl')
+    # Dense float32 (coef, intercept) built from the weights saved alongside
+    # the sklearn model; scoring with it skips sklearn's per-call validation
+    weights = load_weights('models/sentiment_weights.pkl')
+    vectorizer = use_inplace_idf(build_vectorizer(**joblib.load('models/tfidf_idf.pkl')))
     print("✓ Model loaded successfully!\n")
     
     # Interactive testing
@@ -54,7 +120,7 @@ def main():
         if not text:
             continue
         
-        result = predict_sentiment(text, model, vectorizer)
+        result = predict_sentiment(text, weights, vectorizer)
         
         print(f"\nSentiment: {result['sentiment'].upper()}")
         print(f"Confidence: {result['confidence']:.2%}")
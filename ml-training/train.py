@@ -3,30 +3,111 @@ Train sentiment analysis model on IMDB 50K dataset
 """
 import os
 import json
+import hashlib
+import inspect
 import time
 from datetime import datetime
 import numpy as np
-import pandas as pd
-from sklearn.feature_extraction.text import TfidfVectorizer
+import scipy.sparse as sp
+from scipy.special import expit
+from sklearn.feature_extraction.text import TfidfTransformer
 from sklearn.linear_model import LogisticRegression
 from sklearn.metrics import accuracy_score, precision_recall_fscore_support, confusion_matrix, classification_report
 from sklearn.model_selection import train_test_split
 import joblib
+from joblib import Parallel, delayed
 from datasets import load_dataset
-import re
-from tqdm import tqdm
+from preprocessing import build_vectorizer, clean_text, make_hasher
 
-def clean_text(text):
-    """Clean and preprocess text"""
-    # Remove HTML tags
-    text = re.sub(r'<[^>]+>', '', text)
-    # Remove special characters but keep basic punctuation
-    text = re.sub(r'[^a-zA-Z0-9\s\.\!\?]', '', text)
-    # Convert to lowercase
-    text = text.lower()
-    # Remove extra whitespace
-    text = ' '.join(text.split())
-    return text
+CACHE_DIR = '.cache'
+# LZ4 decompresses far faster than zlib, which keeps cold starts short
+JOBLIB_COMPRESS = ('lz4', 3)
+
+def feature_cache_path(tfidf_params):
+    """Cache file for features built with the current feature code and TF-IDF params"""
+    # Preprocessing plus the train.py functions that build the cached matrices
+    source = inspect.getsource(inspect.getmodule(clean_text)) + ''.join(
+        inspect.getsource(fn) for fn in (clean_batch, hash_texts, fit_hashed_tfidf, build_features)
+    )
+    key = hashlib.sha1((source + repr(tfidf_params)).encode()).hexdigest()[:12]
+    return os.path.join(CACHE_DIR, f'features_{key}.pkl')
+
+def clean_batch(batch):
+    """Clean a batch of reviews for Dataset.map"""
+    return {'text': [clean_text(text) for text in batch['text']]}
+
+def cleaning_fingerprint(split_dataset):
+    """Arrow-cache fingerprint for a cleaned split, tied to the cleaning source"""
+    # datasets pickles the imported clean_text by reference, so its own
+    # fingerprint would not change when the cleaning code does
+    source = inspect.getsource(inspect.getmodule(clean_text)) + inspect.getsource(clean_batch)
+    # _fingerprint is a datasets internal (no public accessor as of the pinned
+    # 2.14.5); re-check it when bumping datasets
+    return hashlib.sha1((split_dataset._fingerprint + source).encode()).hexdigest()[:16]
+
+def hash_texts(hasher, texts, n_jobs):
+    """Hash contiguous chunks of texts in parallel and stack them back in order"""
+    chunk_size = -(-len(texts) // n_jobs)
+    chunks = Parallel(n_jobs=n_jobs)(
+        delayed(hasher.transform)(texts[i:i + chunk_size])
+        for i in range(0, len(texts), chunk_size)
+    )
+    return sp.vstack(chunks, format='csr')
+
+def fit_hashed_tfidf(texts, tfidf_params, n_jobs):
+    """Fit a hashed TF-IDF vectorizer, filtering columns like TfidfVectorizer would
+
+    Columns outside the min_df/max_df range, or beyond the max_features most
+    frequent ones, get an IDF of zero so they drop out of every transform.
+    """
+    hasher = make_hasher(tfidf_params['n_features'], tfidf_params['dtype'])
+    counts = hash_texts(hasher, texts, n_jobs)
+    
+    # Document frequencies merged across all chunks
+    n_docs, n_features = counts.shape
+    df = np.bincount(counts.indices, minlength=n_features)
+    keep = (df >= tfidf_params['min_df']) & (df <= tfidf_params['max_df'] * n_docs)
+    term_counts = np.where(keep, np.asarray(counts.sum(axis=0)).ravel(), 0)
+    top = np.argsort(term_counts, kind='stable')[::-1][:tfidf_params['max_features']]
+    keep &= np.isin(np.arange(n_features), top)
+    
+    idf = TfidfTransformer().fit(counts).idf_
+    vectorizer = build_vectorizer(np.where(keep, idf, 0).astype(hasher.dtype),
+                                  sublinear_tf=tfidf_params['sublinear_tf'])
+    
+    # The idf_ setter stores float64, so cast back to the hasher's dtype
+    X = vectorizer[-1].transform(counts).astype(hasher.dtype, copy=False)
+    return vectorizer, X
+
+def build_features(dataset, tfidf_params):
+    """Clean the raw reviews and fit the TF-IDF vectorizer on the training split"""
+    print("\n[2/6] Preprocessing text data...")
+    # Each review is cleaned independently, so let datasets fan batches out
+    # across cores; the cleaned Arrow table is also cached between runs
+    train_texts, test_texts = (
+        dataset[split].map(clean_batch, batched=True, batch_size=1024,
+                           num_proc=os.cpu_count(), desc=f"Cleaning {split}",
+                           new_fingerprint=cleaning_fingerprint(dataset[split]))['text']
+        for split in ('train', 'test')
+    )
+    
+    print(f"✓ Preprocessing complete!")
+    
+    # Create TF-IDF features
+    print("\n[3/6] Creating TF-IDF features...")
+    print(f"Parameters: max_features={tfidf_params['max_features']}, "
+          f"min_df={tfidf_params['min_df']}, ngram_range=(1, 2), "
+          f"sublinear_tf={tfidf_params['sublinear_tf']}")
+    
+    # Hashing needs no shared vocabulary, so chunks are vectorized in parallel
+    n_jobs = os.cpu_count()
+    start_time = time.time()
+    vectorizer, X_train = fit_hashed_tfidf(train_texts, tfidf_params, n_jobs)
+    hasher, tfidf = vectorizer[0], vectorizer[-1]
+    X_test = tfidf.transform(hash_texts(hasher, test_texts, n_jobs)).astype(hasher.dtype, copy=False)
+    vectorization_time = time.time() - start_time
+    
+    return X_train, X_test, vectorizer, vectorization_time
 
 def main():
     print("=" * 80)
@@ -46,45 +127,54 @@ def main():
     print(f"  - Training samples: {len(dataset['train']):,}")
     print(f"  - Test samples: {len(dataset['test']):,}")
     
-    # Prepare data
-    print("\n[2/6] Preprocessing text data...")
-    train_texts = [clean_text(text) for text in tqdm(dataset['train']['text'], desc="Cleaning train")]
-    train_labels = dataset['train']['label']
-    test_texts = [clean_text(text) for text in tqdm(dataset['test']['text'], desc="Cleaning test")]
-    test_labels = dataset['test']['label']
-    
-    print(f"✓ Preprocessing complete!")
-    
-    # Create TF-IDF features
-    print("\n[3/6] Creating TF-IDF features...")
-    print("Parameters: max_features=10000, ngram_range=(1,2)")
-    
-    vectorizer = TfidfVectorizer(
-        max_features=10000,
-        ngram_range=(1, 2),
-        min_df=5,
-        max_df=0.8,
-        stop_words='english'
-    )
-    
-    start_time = time.time()
-    X_train = vectorizer.fit_transform(train_texts)
-    X_test = vectorizer.transform(test_texts)
-    vectorization_time = time.time() - start_time
-    
-    print(f"✓ TF-IDF vectorization complete! ({vectorization_time:.2f}s)")
-    print(f"  - Feature dimension: {X_train.shape[1]:,}")
+    # Typed label arrays, so sklearn has nothing to convert
+    train_labels = np.asarray(dataset['train'].with_format('numpy')['label'], dtype=np.int8)
+    test_labels = np.asarray(dataset['test'].with_format('numpy')['label'], dtype=np.int8)
+    
+    tfidf_params = {
+        'n_features': 2**18,
+        'max_features': 5000,
+        'min_df': 20,
+        'max_df': 0.8,
+        'sublinear_tf': True,
+        'dtype': np.float32
+    }
+    cache_path = feature_cache_path(tfidf_params)
+    
+    if os.path.exists(cache_path):
+        print("\n[2/6] Preprocessing text data... skipped")
+        print("\n[3/6] Creating TF-IDF features... skipped")
+        start_time = time.time()
+        X_train, X_test, vectorizer = joblib.load(cache_path)
+        features_load_time = time.time() - start_time
+        # Nothing was vectorized on this run
+        vectorization_time = None
+        print(f"✓ Loaded cached features from: {cache_path} ({features_load_time:.2f}s)")
+    else:
+        X_train, X_test, vectorizer, vectorization_time = build_features(dataset, tfidf_params)
+        features_load_time = None
+        print(f"✓ TF-IDF vectorization complete! ({vectorization_time:.2f}s)")
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        joblib.dump((X_train, X_test, vectorizer), cache_path, compress=JOBLIB_COMPRESS)
+        print(f"✓ Cached features to: {cache_path}")
+    
+    n_active_features = int(np.count_nonzero(vectorizer[-1].idf_))
+    print(f"  - Feature dimension: {X_train.shape[1]:,} hashed, {n_active_features:,} active")
     print(f"  - Train matrix shape: {X_train.shape}")
     print(f"  - Test matrix shape: {X_test.shape}")
     
     # Train Logistic Regression model
     print("\n[4/6] Training Logistic Regression model...")
-    print("Parameters: C=1.0, max_iter=1000, solver='lbfgs'")
+    print("Parameters: C=1.0, penalty='l1', max_iter=100, tol=1e-3, solver='saga'")
     
+    # TF-IDF rows are already L2-normalized, which is what saga converges best on.
+    # L1 drives most weights to exactly zero, so inference can use a sparse coef.
     model = LogisticRegression(
         C=1.0,
-        max_iter=1000,
-        solver='lbfgs',
+        penalty='l1',
+        max_iter=100,
+        tol=1e-3,
+        solver='saga',
         random_state=42,
         verbose=1
     )
@@ -93,7 +183,12 @@ def main():
     model.fit(X_train, train_labels)
     training_time = time.time() - start_time
     
+    # Keep only the weights L1 left nonzero
+    coef = np.where(np.abs(model.coef_) > 1e-6, model.coef_, 0).astype(np.float32)
+    sparse_coef = sp.csr_matrix(coef)
+    
     print(f"\n✓ Training complete! ({training_time:.2f}s)")
+    print(f"  - Nonzero weights: {sparse_coef.nnz:,} / {coef.shape[1]:,}")
     
     # Evaluate model
     print("\n[5/6] Evaluating model performance...")
@@ -131,24 +226,32 @@ def main():
     print(f"\n[6/6] Saving model and results...")
     
     model_path = 'models/sentiment_model.pkl'
-    vectorizer_path = 'models/tfidf_vectorizer.pkl'
+    weights_path = 'models/sentiment_weights.pkl'
+    idf_path = 'models/tfidf_idf.pkl'
     
-    joblib.dump(model, model_path)
-    joblib.dump(vectorizer, vectorizer_path)
+    joblib.dump(model, model_path, compress=JOBLIB_COMPRESS)
+    joblib.dump((sparse_coef, float(model.intercept_[0])), weights_path, compress=JOBLIB_COMPRESS)
+    # The hasher is rebuilt from constants, so the IDF vector is all that's stored
+    tfidf = vectorizer[-1]
+    joblib.dump({'idf': tfidf.idf_.astype(np.float32), 'sublinear_tf': tfidf.sublinear_tf},
+                idf_path, compress=JOBLIB_COMPRESS)
     
     print(f"✓ Model saved to: {model_path}")
-    print(f"✓ Vectorizer saved to: {vectorizer_path}")
+    print(f"✓ Sparse weights saved to: {weights_path}")
+    print(f"✓ IDF vector saved to: {idf_path}")
     
     # Save training results
     results = {
         'timestamp': datetime.now().isoformat(),
         'dataset': 'IMDB 50K',
         'model': 'Logistic Regression',
-        'training_samples': len(train_texts),
-        'test_samples': len(test_texts),
-        'features': X_train.shape[1],
+        'training_samples': X_train.shape[0],
+        'test_samples': X_test.shape[0],
+        'features': n_active_features,
+        'nonzero_weights': sparse_coef.nnz,
         'training_time_seconds': round(training_time, 2),
-        'vectorization_time_seconds': round(vectorization_time, 2),
+        'vectorization_time_seconds': None if vectorization_time is None else round(vectorization_time, 2),
+        'features_load_time_seconds': None if features_load_time is None else round(features_load_time, 2),
         'metrics': {
             'train_accuracy': round(train_accuracy, 4),
             'test_accuracy': round(test_accuracy, 4),
@@ -163,11 +266,16 @@ def main():
             'tp': int(cm[1][1])
         },
         'hyperparameters': {
-            'tfidf_max_features': 10000,
+            'tfidf_n_features': tfidf_params['n_features'],
+            'tfidf_max_features': tfidf_params['max_features'],
+            'tfidf_min_df': tfidf_params['min_df'],
+            'tfidf_sublinear_tf': tfidf_params['sublinear_tf'],
             'tfidf_ngram_range': '(1, 2)',
             'lr_C': 1.0,
-            'lr_max_iter': 1000,
-            'lr_solver': 'lbfgs'
+            'lr_penalty': 'l1',
+            'lr_max_iter': 100,
+            'lr_tol': 1e-3,
+            'lr_solver': 'saga'
         }
     }
     
@@ -204,11 +312,14 @@ def main():
         "Boring and predictable. Would not recommend."
     ]
     
+    # Score every sample with one transform and one decision_function call
+    X_samples = vectorizer.transform([clean_text(text) for text in test_samples])
+    z = model.decision_function(X_samples.astype(X_train.dtype, copy=False))
+    p1 = expit(z)
+    
     for i, text in enumerate(test_samples, 1):
-        cleaned = clean_text(text)
-        vec = vectorizer.transform([cleaned])
-        pred = model.predict(vec)[0]
-        prob = model.predict_proba(vec)[0]
+        pred = int(z[i - 1] > 0)
+        prob = (1.0 - p1[i - 1], p1[i - 1])
         sentiment = "Positive" if pred == 1 else "Negative"
         confidence = prob[pred]
         